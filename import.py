@@ -15,13 +15,24 @@ import os
 import re
 import subprocess
 import tempfile
+import threading
 import qif
 from decimal import Decimal
+from multiprocessing.pool import ThreadPool
 
 from gnucash import Session, Transaction, Split, GncNumeric
 
 MTP_SCHEME = 'mtp:'
 
+log = logging.getLogger(__name__)
+
+# input files are read in parallel, see main()
+READ_THREADS = 4
+# only one process can talk to the MTP device at a time
+mtp_lock = threading.Lock()
+# guards the set of imported file names shared by the reader threads
+imported_lock = threading.Lock()
+
 
 def lookup_account_by_path(root, path):
     acc = root.lookup_by_name(path[0])
@@ -37,11 +48,18 @@ def lookup_account(root, name):
     return lookup_account_by_path(root, path)
 
 
-def add_transaction(book, item, currency):
-    logging.info('Adding transaction for account "%s" (%s %s)..', item.account, item.split_amount,
+def lookup_account_cached(root, name, cache):
+    acc = cache.get(name)
+    if acc is None:
+        acc = cache[name] = lookup_account(root, name)
+    return acc
+
+
+def add_transaction(book, root, item, currency, accounts):
+    if log.isEnabledFor(logging.INFO):
+        log.info('Adding transaction for account "%s" (%s %s)..', item.account, item.split_amount,
                  currency.get_mnemonic())
-    root = book.get_root_account()
-    acc = lookup_account(root, item.account)
+    acc = lookup_account_cached(root, item.account, accounts)
 
     tx = Transaction(book)
     tx.BeginEdit()
@@ -53,16 +71,21 @@ def add_transaction(book, item, currency):
     s1 = Split(book)
     s1.SetParent(tx)
     s1.SetAccount(acc)
-    amount = int(Decimal(item.split_amount.replace(',', '.')) * currency.get_fraction())
-    s1.SetValue(GncNumeric(amount, currency.get_fraction()))
-    s1.SetAmount(GncNumeric(amount, currency.get_fraction()))
-
-    acc2 = lookup_account(root, item.split_category)
+    fraction = currency.get_fraction()
+    split_amount = item.split_amount
+    if ',' in split_amount:
+        # decimal comma
+        split_amount = split_amount.replace(',', '.')
+    amount = int(Decimal(split_amount) * fraction)
+    s1.SetValue(GncNumeric(amount, fraction))
+    s1.SetAmount(GncNumeric(amount, fraction))
+
+    acc2 = lookup_account_cached(root, item.split_category, accounts)
     s2 = Split(book)
     s2.SetParent(tx)
     s2.SetAccount(acc2)
-    s2.SetValue(GncNumeric(amount * -1, currency.get_fraction()))
-    s2.SetAmount(GncNumeric(amount * -1, currency.get_fraction()))
+    s2.SetValue(GncNumeric(amount * -1, fraction))
+    s2.SetAmount(GncNumeric(amount * -1, fraction))
 
     tx.CommitEdit()
 
@@ -70,8 +93,8 @@ def add_transaction(book, item, currency):
 def read_entries_from_mtp_file(file_id, filename):
     with tempfile.NamedTemporaryFile(suffix=filename) as fd:
         subprocess.check_call(['mtp-getfile', file_id, fd.name])
-        entries_from_qif = qif.parse_qif(fd)
-    logging.debug('Read %s entries from %s', len(entries_from_qif), filename)
+        entries_from_qif = qif.parse_qif(fd.read().splitlines())
+    log.debug('Read %s entries from %s', len(entries_from_qif), filename)
     return entries_from_qif
 
 
@@ -95,35 +118,39 @@ def get_mtp_files():
 def read_entries_from_mtp(pattern, imported):
     entries = []
     regex = re.compile(pattern)
-    for file_id, filename in get_mtp_files():
-        if regex.match(filename):
-            logging.debug('Found matching file on MTP device: "%s" (ID: %s)', filename, file_id)
-            if filename in imported:
-                logging.info('Skipping %s (already imported)', filename)
-            else:
-                entries.extend(read_entries_from_mtp_file(file_id, filename))
-                imported.add(filename)
+    with mtp_lock:
+        for file_id, filename in get_mtp_files():
+            if regex.match(filename):
+                log.debug('Found matching file on MTP device: "%s" (ID: %s)', filename, file_id)
+                if filename in imported:
+                    log.info('Skipping %s (already imported)', filename)
+                else:
+                    entries.extend(read_entries_from_mtp_file(file_id, filename))
+                    with imported_lock:
+                        imported.add(filename)
     return entries
 
 
 def read_entries(fn, imported):
-    logging.debug('Reading %s..', fn)
+    log.debug('Reading %s..', fn)
     if fn.startswith(MTP_SCHEME):
         items = read_entries_from_mtp(fn[len(MTP_SCHEME):], imported)
     else:
         base = os.path.basename(fn)
         if base in imported:
-            logging.info('Skipping %s (already imported)', base)
+            log.info('Skipping %s (already imported)', base)
             return []
         with open(fn) as fd:
-            items = qif.parse_qif(fd)
-        imported.add(fn)
-    logging.debug('Read %s items from %s', len(items), fn)
+            # one bulk read instead of a readline() per QIF line
+            items = qif.parse_qif(fd.read().splitlines())
+        with imported_lock:
+            imported.add(fn)
+    log.debug('Read %s items from %s', len(items), fn)
     return items
 
 
 def write_transactions_to_gnucash(gnucash_file, currency, all_items, dry_run=False, date_from=None):
-    logging.debug('Opening GnuCash file %s..', gnucash_file)
+    log.debug('Opening GnuCash file %s..', gnucash_file)
     session = Session(gnucash_file)
     book = session.book
     commod_tab = book.get_table()
@@ -132,22 +159,34 @@ def write_transactions_to_gnucash(gnucash_file, currency, all_items, dry_run=Fal
     if date_from:
         date_from = datetime.datetime.strptime(date_from, '%Y-%m-%d')
 
+    # filter everything up front so that the book is only touched by a single batch of edits
+    new_items = []
     imported_items = set()
+    log_info = log.isEnabledFor(logging.INFO)
     for item in all_items:
         if date_from and item.date < date_from:
-            logging.info('Skipping entry %s (%s)', item.date.strftime('%Y-%m-%d'), item.split_amount)
+            if log_info:
+                log.info('Skipping entry %s (%s)', item.date.strftime('%Y-%m-%d'), item.split_amount)
             continue
-        if item.as_tuple() in imported_items:
-            logging.info('Skipping entry %s (%s) --- already imported!', item.date.strftime('%Y-%m-%d'),
+        key = item.as_tuple()
+        if key in imported_items:
+            if log_info:
+                log.info('Skipping entry %s (%s) --- already imported!', item.date.strftime('%Y-%m-%d'),
                          item.split_amount)
             continue
-        add_transaction(book, item, currency)
-        imported_items.add(item.as_tuple())
+        new_items.append(item)
+        imported_items.add(key)
+
+    root = book.get_root_account()
+    # resolved accounts by full name, QIF files mostly use a handful of accounts/categories
+    accounts = {}
+    for item in new_items:
+        add_transaction(book, root, item, currency, accounts)
 
     if dry_run:
-        logging.debug('** DRY-RUN **')
+        log.debug('** DRY-RUN **')
     else:
-        logging.debug('Saving GnuCash file..')
+        log.debug('Saving GnuCash file..')
         session.save()
     session.end()
 
@@ -162,24 +201,41 @@ def main(args):
 
     logging.basicConfig(level=lvl)
 
-    imported_cache = os.path.expanduser('~/.gnucash-qif-import-cache.json')
+    # one imported file name per line, new names are appended after each run
+    imported_cache = os.path.expanduser('~/.gnucash-qif-import-cache')
+    legacy_cache = imported_cache + '.json'
     if os.path.exists(imported_cache):
         with open(imported_cache) as fd:
+            imported = set(fd.read().splitlines())
+    elif os.path.exists(legacy_cache):
+        with open(legacy_cache) as fd:
             imported = set(json.load(fd))
     else:
         imported = set()
+    # names already stored in the line-oriented cache file
+    cached = set(imported) if os.path.exists(imported_cache) else set()
+
+    # parsing is mostly waiting on file (or MTP) I/O, so overlap it across input files;
+    # writing to GnuCash stays serial
+    pool = ThreadPool(min(READ_THREADS, len(args.file)))
+    try:
+        results = pool.map(lambda fn: read_entries(fn, imported), args.file)
+    finally:
+        pool.close()
+        pool.join()
 
     all_items = []
-    for fn in args.file:
-        all_items.extend(read_entries(fn, imported))
+    for items in results:
+        all_items.extend(items)
 
     if all_items:
         write_transactions_to_gnucash(args.gnucash_file, args.currency, all_items, dry_run=args.dry_run,
                                       date_from=args.date_from)
 
     if not args.dry_run:
-        with open(imported_cache, 'wb') as fd:
-            json.dump(list(imported), fd)
+        with open(imported_cache, 'a') as fd:
+            for name in sorted(imported - cached):
+                fd.write(name + '\n')
 
 
 if __name__ == '__main__':
@@ -14,23 +14,40 @@ import sys
 import datetime
 
 
-class QifItem:
+class QifItem(object):
+
+    __slots__ = (
+        'type',
+        'date',
+        'account',
+        'amount',
+        'cleared',
+        'num',
+        'payee',
+        'memo',
+        'address',
+        'category',
+        'split_category',
+        'split_memo',
+        'split_amount',
+    )
+
+    order = (
+        'date',
+        'account',
+        'amount',
+        'cleared',
+        'num',
+        'payee',
+        'memo',
+        'address',
+        'category',
+        'split_category',
+        'split_memo',
+        'split_amount',
+    )
 
     def __init__(self):
-        self.order = [
-            'date',
-            'account',
-            'amount',
-            'cleared',
-            'num',
-            'payee',
-            'memo',
-            'address',
-            'category',
-            'split_category',
-            'split_memo',
-            'split_amount',
-        ]
         self.type = None
         self.date = None
         self.account = None
@@ -46,62 +63,83 @@ class QifItem:
         self.split_amount = None
 
     def as_tuple(self):
-        return tuple([self.__dict__[field] for field in self.order])
+        return tuple([getattr(self, field) for field in self.order])
 
     def __str__(self):
         titles = ','.join(self.order)
-        tmpstring = ','.join([str(self.__dict__[field]) for field in self.order])
+        tmpstring = ','.join([str(getattr(self, field)) for field in self.order])
         tmpstring = tmpstring.replace('None', '')
         return titles + '\n' + tmpstring
 
 
+# parsed dates by their QIF string, many entries in a file share the same date
+_date_cache = {}
+
+
+def _set_date(item, data):
+    date = _date_cache.get(data)
+    if date is None:
+        year, month, day = map(int, data.split('/'))
+        date = _date_cache[data] = datetime.datetime(year=year, month=month, day=day)
+    item.date = date
+
+
+def _setter(field):
+    def set_field(item, data):
+        setattr(item, field, data)
+    return set_field
+
+
+# line handlers keyed by the QIF field code (first character of the line)
+_QIF_DISPATCH = {
+    'D': _set_date,
+    'T': _setter('amount'),
+    'C': _setter('cleared'),
+    'P': _setter('payee'),
+    'M': _setter('memo'),
+    'A': _setter('address'),
+    'L': _setter('category'),
+    'S': _setter('split_category'),
+    'E': _setter('split_memo'),
+    '$': _setter('split_amount'),
+    '!': _setter('type'),
+}
+
+
 def parse_qif(infile):
     """
     Parse a qif file and return a list of entries.
-    infile should be open file-like object (supporting readline() ).
+    infile can be any iterable of lines, e.g. an open file-like object or
+    the result of reading the whole file and calling splitlines().
     """
 
     account = None
     items = []
-    curItem = QifItem()
+    # local bindings for the per-line hot path
+    append = items.append
+    dispatch = _QIF_DISPATCH.get
+    new_item = QifItem
+    curItem = new_item()
     for line in infile:
+        if not line:  # blank line (from splitlines)
+            continue
         firstchar = line[0]
         data = line[1:].strip()
-        if firstchar == '\n':  # blank line
+        handler = dispatch(firstchar)
+        if handler is not None:
+            handler(curItem, data)
+        elif firstchar == '\n':  # blank line
             pass
         elif firstchar == '^':
                                # end of item
             if curItem.type != 'Account':
                 # save the item
-                items.append(curItem)
-            curItem = QifItem()
+                append(curItem)
+            curItem = new_item()
             curItem.account = account
-        elif firstchar == 'D':
-            year, month, day = map(int, data.split('/'))
-            curItem.date = datetime.datetime(year=year, month=month, day=day)
-        elif firstchar == 'T':
-            curItem.amount = data
-        elif firstchar == 'C':
-            curItem.cleared = data
-        elif firstchar == 'P':
-            curItem.payee = data
-        elif firstchar == 'M':
-            curItem.memo = data
-        elif firstchar == 'A':
-            curItem.address = data
-        elif firstchar == 'L':
-            curItem.category = data
-        elif firstchar == 'S':
-            curItem.split_category = data
-        elif firstchar == 'E':
-            curItem.split_memo = data
-        elif firstchar == '$':
-            curItem.split_amount = data
         elif firstchar == 'N':
             if curItem.type == 'Account':
                 account = data
-        elif firstchar == '!':
-            curItem.type = data
         else:
             # don't recognise this line; ignore it
             print >> sys.stderr, 'Skipping unknown line:\n', line
@@ -111,6 +149,6 @@ def parse_qif(infile):
 
 if __name__ == '__main__':
     # read from stdin and write CSV to stdout
-    items = parse_qif(sys.stdin)
+    items = parse_qif(sys.stdin.read().splitlines())
     for item in items:
         print item